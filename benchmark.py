@@ -0,0 +1,191 @@
+import argparse
+import json
+import platform
+import resource
+import time
+import tracemalloc
+
+import numpy as np
+
+import cplex_mdp_solver
+from delivery_mdp import DeliveryMDP
+from grid_world_mdp import GridWorldMDP
+
+PHASES = ['domain_construction', 'compilation', 'validation', 'pruning', 'decomposition', 'constraint_assembly', 'solve', 'policy_extraction']
+
+
+def generate_grid_world(height, width, wall_density, seed=None):
+    random = np.random.default_rng(seed)
+
+    grid_world = [['W' if random.random() < wall_density else 'O' for _ in range(width)] for _ in range(height)]
+
+    # The goal is placed on a random cell that is always open
+    goal_row, goal_column = random.integers(height), random.integers(width)
+    grid_world[goal_row][goal_column] = 'G'
+
+    return grid_world
+
+
+def generate_world_map(n_locations, extra_path_probability=0.1, seed=None):
+    random = np.random.default_rng(seed)
+
+    locations = ['LOCATION_{}'.format(index) for index in range(n_locations)]
+    poses = random.uniform(0, 10 * np.sqrt(n_locations), size=(n_locations, 2))
+
+    world_map = {
+        'name': 'generated_{}'.format(n_locations),
+        'locations': {location: {'name': location, 'pose': {'x': float(x), 'y': float(y), 'theta': 0.0}} for location, (x, y) in zip(locations, poses)},
+        'paths': {location: {} for location in locations}
+    }
+
+    def add_path(i, j):
+        cost = int(np.ceil(10 * np.linalg.norm(poses[i] - poses[j])))
+        world_map['paths'][locations[i]][locations[j]] = {'cost': cost}
+        world_map['paths'][locations[j]][locations[i]] = {'cost': cost}
+
+    # A random spanning tree keeps every location connected before any extra paths are added
+    order = random.permutation(n_locations)
+    for position in range(1, n_locations):
+        add_path(order[position], order[random.integers(position)])
+
+    for i in range(n_locations):
+        for j in range(i + 1, n_locations):
+            if random.random() < extra_path_probability:
+                add_path(i, j)
+
+    return world_map
+
+
+def __measure(phases, phase, function, *arguments, **keyword_arguments):
+    start_time = time.perf_counter()
+    result = function(*arguments, **keyword_arguments)
+    phases[phase] = time.perf_counter() - start_time
+    return result
+
+
+def __get_options(backend, lp_options, options):
+    # LP options such as the formulation or the block size do not apply to the iterative backends
+    if backend in cplex_mdp_solver.LP_BACKENDS and lp_options is not None:
+        return dict(options, **lp_options)
+    return dict(options)
+
+
+def warm_up(backends, gamma=0.99):
+    # Solving a tiny grid world first keeps the lazy solver imports out of the timings of the first run
+    for backend in backends:
+        cplex_mdp_solver.solve(GridWorldMDP([['O', 'G']]), gamma, backend=backend, quiet=True)
+
+
+def run(create_mdp, gamma, backend, trace_memory=True, **options):
+    phases = {}
+    record = {'backend': backend, 'gamma': gamma, 'options': options}
+
+    if trace_memory:
+        tracemalloc.start()
+
+    try:
+        mdp = __measure(phases, 'domain_construction', create_mdp)
+
+        # The run goes through solve so that it times every phase that solve runs, as recorded in its metrics
+        metrics = {}
+        solution = cplex_mdp_solver.solve(mdp, gamma, backend=backend, quiet=True, callback=metrics.update, **options)
+        phases.update(metrics['phases'])
+
+        record['objective_value'] = solution['objective_value']
+        for name in ['n_states', 'n_actions', 'n_transitions', 'n_variables', 'n_constraints', 'n_nonzeros', 'iterations', 'status']:
+            if name in metrics:
+                record[name] = metrics[name]
+    except Exception as error:
+        # A failed run, for example one over the size limits of a solver, is recorded so that the rest of the suite still runs
+        record['error'] = '{}: {}'.format(type(error).__name__, error)
+    finally:
+        if trace_memory:
+            record['peak_traced_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    record['phases'] = phases
+    record['total_time'] = sum(phases.values())
+
+    # The maximum resident set size covers native solver memory but never decreases over the process
+    record['max_rss_kilobytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return record
+
+
+def run_grid_world_suite(sizes, wall_densities, backends, gamma=0.99, seed=0, trace_memory=True, lp_options=None, **options):
+    warm_up(backends, gamma)
+
+    records = []
+
+    for size in sizes:
+        for wall_density in wall_densities:
+            grid_world = generate_grid_world(size, size, wall_density, seed)
+            for backend in backends:
+                record = run(lambda: GridWorldMDP(grid_world), gamma, backend, trace_memory, **__get_options(backend, lp_options, options))
+                record.update({'domain': 'grid_world', 'size': size, 'wall_density': wall_density, 'seed': seed})
+                records.append(record)
+
+    return records
+
+
+def run_delivery_suite(location_counts, backends, gamma=0.99, seed=0, trace_memory=True, lp_options=None, **options):
+    warm_up(backends, gamma)
+
+    records = []
+
+    for n_locations in location_counts:
+        world_map = generate_world_map(n_locations, seed=seed)
+        locations = list(world_map['locations'])
+        pickup_location, dropoff_location = locations[0], locations[-1]
+        for backend in backends:
+            record = run(lambda: DeliveryMDP(world_map, pickup_location, dropoff_location), gamma, backend, trace_memory, **__get_options(backend, lp_options, options))
+            record.update({'domain': 'delivery', 'n_locations': n_locations, 'seed': seed})
+            records.append(record)
+
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the MDP solvers on generated domains of growing size.')
+    parser.add_argument('--domain', choices=['grid_world', 'delivery'], default='grid_world')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 10, 20], help='grid side lengths or numbers of locations')
+    parser.add_argument('--wall-densities', type=float, nargs='+', default=[0.1, 0.3])
+    parser.add_argument('--backends', nargs='+', default=['cplex', 'highs', 'policy_iteration'])
+    parser.add_argument('--gamma', type=float, default=0.99)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-trace-memory', action='store_true', help='skip tracemalloc, which slows every phase down')
+    parser.add_argument('--formulation', choices=cplex_mdp_solver.FORMULATIONS, default='primal')
+    parser.add_argument('--block-size', type=int, default=None, help='stream the primal constraints into CPLEX in blocks of this many rows')
+    parser.add_argument('--prune-unreachable', action='store_true')
+    parser.add_argument('--topological', action='store_true')
+    parser.add_argument('--no-validate', action='store_true')
+    parser.add_argument('--output', default='benchmark_results.json')
+    arguments = parser.parse_args()
+
+    lp_options = {'formulation': arguments.formulation}
+    if arguments.block_size is not None:
+        lp_options['block_size'] = arguments.block_size
+    options = {'prune_unreachable': arguments.prune_unreachable, 'topological': arguments.topological, 'validate': not arguments.no_validate}
+
+    if arguments.domain == 'grid_world':
+        records = run_grid_world_suite(arguments.sizes, arguments.wall_densities, arguments.backends, arguments.gamma, arguments.seed, not arguments.no_trace_memory, lp_options, **options)
+    else:
+        records = run_delivery_suite(arguments.sizes, arguments.backends, arguments.gamma, arguments.seed, not arguments.no_trace_memory, lp_options, **options)
+
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'phases': PHASES,
+        'records': records
+    }
+
+    with open(arguments.output, 'w') as file:
+        json.dump(results, file, indent=4)
+
+    for record in records:
+        print(json.dumps({key: value for key, value in record.items() if key != 'phases'}))
+
+
+if __name__ == '__main__':
+    main()
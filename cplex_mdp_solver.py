@@ -1,5 +1,31 @@
-import cplex
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import breadth_first_order, connected_components
+
+import iterative_mdp_solver
+import mdp_validation
+
+ITERATIVE_BACKENDS = ['value_iteration', 'policy_iteration', 'modified_policy_iteration']
+FORMULATIONS = ['primal', 'dual']
+CPLEX_ALGORITHMS = {
+    'auto': 'auto',
+    'primal_simplex': 'primal',
+    'dual_simplex': 'dual',
+    'barrier': 'barrier',
+    'network': 'network'
+}
+HIGHS_ALGORITHMS = {
+    'auto': 'highs',
+    'dual_simplex': 'highs-ds',
+    'barrier': 'highs-ipm'
+}
+
+# The values of the primal can be negative while the occupancies of the dual cannot
+VALUE_BOUNDS = (None, None)
+OCCUPANCY_BOUNDS = (0, None)
 
 
 class MemoryMDP:
@@ -10,23 +36,142 @@ class MemoryMDP:
         self.n_states = len(self.states)
         self.n_actions = len(self.actions)
 
+        # MDPs that can compile their own arrays skip the per-state callbacks altogether
+        if hasattr(mdp, 'compile_arrays'):
+            self.rewards, self.transition_probabilities, self.start_state_probabilities = mdp.compile_arrays()
+            self.is_sparse = sp.issparse(self.transition_probabilities)
+            return
+
         self.rewards = np.zeros(shape=(self.n_states, self.n_actions))
         for state in range(self.n_states):
             for action in range(self.n_actions):
                 self.rewards[state, action] = mdp.reward_function(self.states[state], self.actions[action])
 
-        self.transition_probabilities = np.zeros(shape=(self.n_states, self.n_actions, self.n_states))
-        for state in range(self.n_states):
-            for action in range(self.n_actions):
-                for successorState in range(self.n_states):
-                    self.transition_probabilities[state, action, successorState] = mdp.transition_function(self.states[state], self.actions[action], self.states[successorState])
+        # MDPs that can enumerate their nonzero successors get a sparse (S * A, S) matrix in CSR format instead of a dense (S, A, S) tensor
+        self.is_sparse = hasattr(mdp, 'successors')
+        if self.is_sparse:
+            self.transition_probabilities = self.__compute_sparse_transition_probabilities(mdp)
+        else:
+            self.transition_probabilities = np.zeros(shape=(self.n_states, self.n_actions, self.n_states))
+            for state in range(self.n_states):
+                for action in range(self.n_actions):
+                    for successorState in range(self.n_states):
+                        self.transition_probabilities[state, action, successorState] = mdp.transition_function(self.states[state], self.actions[action], self.states[successorState])
 
         self.start_state_probabilities = np.zeros(self.n_states)
         for state in range(self.n_states):
             self.start_state_probabilities[state] = mdp.start_state_function(self.states[state])
 
+    @classmethod
+    def from_arrays(cls, states, actions, rewards, transition_probabilities, start_state_probabilities):
+        memory_mdp = cls.__new__(cls)
+
+        memory_mdp.states = states
+        memory_mdp.actions = actions
+
+        memory_mdp.n_states = len(states)
+        memory_mdp.n_actions = len(actions)
 
-def __validate(memory_mdp):
+        memory_mdp.rewards = rewards
+        memory_mdp.is_sparse = sp.issparse(transition_probabilities)
+        memory_mdp.transition_probabilities = transition_probabilities
+        memory_mdp.start_state_probabilities = start_state_probabilities
+
+        return memory_mdp
+
+    def __compute_sparse_transition_probabilities(self, mdp):
+        state_indices = {state: index for index, state in enumerate(self.states)}
+
+        indptr = [0]
+        indices = []
+        data = []
+
+        # Row (state * n_actions + action) holds the successor distribution of that (state, action) pair
+        for state in range(self.n_states):
+            for action in range(self.n_actions):
+                for successor_state, probability in mdp.successors(self.states[state], self.actions[action]):
+                    if probability != 0:
+                        indices.append(state_indices[successor_state])
+                        data.append(probability)
+                indptr.append(len(indices))
+
+        transition_probabilities = sp.csr_matrix((np.array(data, dtype=float), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)), shape=(self.n_states * self.n_actions, self.n_states))
+        transition_probabilities.sum_duplicates()
+
+        return transition_probabilities
+
+    def get_transition_matrix(self, start=0, stop=None):
+        # Row (state * n_actions + action) holds the successor distribution of that (state, action) pair
+        if self.is_sparse:
+            if start == 0 and stop is None:
+                return self.transition_probabilities
+            return self.transition_probabilities[start:stop]
+        return sp.csr_matrix(self.transition_probabilities.reshape(self.n_states * self.n_actions, self.n_states)[start:stop])
+
+    def get_state_indicator(self, rows):
+        # Row (state * n_actions + action) has a 1 in the column of its own state
+        return sp.csr_matrix((
+            np.ones(len(rows)),
+            np.asarray(rows) // self.n_actions,
+            np.arange(len(rows) + 1)
+        ), shape=(len(rows), self.n_states))
+
+    def get_constraint_matrix(self, gamma, start=0, stop=None):
+        start, stop, _ = slice(start, stop).indices(self.n_states * self.n_actions)
+
+        constraint_matrix = (self.get_state_indicator(np.arange(start, stop)) - gamma * self.get_transition_matrix(start, stop)).tocsr()
+        constraint_matrix.eliminate_zeros()
+        constraint_matrix.sort_indices()
+
+        return constraint_matrix
+
+    def get_action_values(self, values, gamma):
+        # Q(s, a) = R(s, a) + gamma * sum_s' P(s' | s, a) V(s') for all (state, action) pairs at once
+        values = np.asarray(values, dtype=float)
+        if self.is_sparse:
+            return self.rewards + gamma * (self.transition_probabilities @ values).reshape(self.n_states, self.n_actions)
+        return self.rewards + gamma * np.einsum('ijk,k->ij', self.transition_probabilities, values)
+
+    def get_state_graph(self):
+        # Entry (state, successor_state) is nonzero if any action can lead from the state to the successor state
+        transition_matrix = self.get_transition_matrix()
+        rows = np.repeat(np.arange(self.n_states), np.diff(transition_matrix.indptr).reshape(self.n_states, self.n_actions).sum(axis=1))
+        return sp.csr_matrix((np.ones(transition_matrix.nnz), (rows, transition_matrix.indices)), shape=(self.n_states, self.n_states))
+
+    def get_reachable_states(self):
+        state_graph = self.get_state_graph().tocoo()
+
+        # A virtual source state leads to every state in the support of the start distribution
+        start_states = np.flatnonzero(self.start_state_probabilities > 0)
+        source = self.n_states
+        graph = sp.csr_matrix((
+            np.ones(state_graph.nnz + len(start_states)),
+            (np.concatenate([state_graph.row, np.full(len(start_states), source)]), np.concatenate([state_graph.col, start_states]))
+        ), shape=(self.n_states + 1, self.n_states + 1))
+
+        reachable_states = breadth_first_order(graph, source, directed=True, return_predecessors=False)
+
+        return np.sort(reachable_states[reachable_states != source])
+
+    def get_rows(self, states):
+        # The rows (state * n_actions + action) of every action of the given states in order
+        return (np.asarray(states)[:, np.newaxis] * self.n_actions + np.arange(self.n_actions)).reshape(-1)
+
+    def restrict(self, states):
+        # The successors of the given states must all be among the given states for the restricted MDP to be exact
+        states = np.asarray(states)
+        transition_probabilities = self.get_transition_matrix()[self.get_rows(states)][:, states]
+
+        return MemoryMDP.from_arrays(
+            [self.states[state] for state in states],
+            self.actions,
+            self.rewards[states],
+            transition_probabilities.tocsr(),
+            self.start_state_probabilities[states]
+        )
+
+
+def __validate(memory_mdp, is_validating_contents=True):
     assert memory_mdp.n_states is not None
     assert memory_mdp.n_actions is not None
 
@@ -37,96 +182,552 @@ def __validate(memory_mdp):
     assert memory_mdp.start_state_probabilities is not None
 
     assert memory_mdp.rewards.shape == (memory_mdp.n_states, memory_mdp.n_actions)
-    assert memory_mdp.transition_probabilities.shape == (memory_mdp.n_states, memory_mdp.n_actions, memory_mdp.n_states)
+    if memory_mdp.is_sparse:
+        assert memory_mdp.transition_probabilities.shape == (memory_mdp.n_states * memory_mdp.n_actions, memory_mdp.n_states)
+    else:
+        assert memory_mdp.transition_probabilities.shape == (memory_mdp.n_states, memory_mdp.n_actions, memory_mdp.n_states)
     assert memory_mdp.start_state_probabilities.shape == (memory_mdp.n_states,)
 
+    # The contents are checked in one vectorized pass over the compiled arrays
+    if is_validating_contents:
+        report = mdp_validation.validate(memory_mdp)
+        assert report['is_valid'], mdp_validation.get_summary(report)
 
-def __set_variables(c, memory_mdp):
-    c.variables.add(types=[c.variables.type.continuous] * memory_mdp.n_states)
 
+def __set_variables(c, n_variables, bounds):
+    import cplex
 
-def __set_objective(c, memory_mdp):
-    c.objective.set_linear([(i, memory_mdp.start_state_probabilities[i]) for i in range(memory_mdp.n_states)])
-    c.objective.set_sense(c.objective.sense.minimize)
+    # A bound of None leaves that side of every variable unbounded
+    lower_bound = -cplex.infinity if bounds[0] is None else float(bounds[0])
+    upper_bound = cplex.infinity if bounds[1] is None else float(bounds[1])
 
+    # Giving the variables explicit types would make CPLEX treat the program as a MIP so they are left as plain continuous variables
+    c.variables.add(lb=[lower_bound] * n_variables, ub=[upper_bound] * n_variables)
 
-def __set_constraints(program, memory_mdp, gamma):
-    lin_expr = []
-    rhs = []
 
-    # Each constraint will use all states' variables (as the "next possible states")
-    variables = range(memory_mdp.n_states)
+def __set_objective(c, objective, maximize):
+    c.objective.set_linear([(i, float(coefficient)) for i, coefficient in enumerate(objective)])
+    c.objective.set_sense(c.objective.sense.maximize if maximize else c.objective.sense.minimize)
 
-    # There is one constraint for each (state, action) pair
-    for i in range(memory_mdp.n_states):
-        for j in range(memory_mdp.n_actions):
-            coefficients = []
-            # Each constraint refers to all state variables (as the "next possible states")
-            # Each coefficient depends on whether the next possible state is the current state or not
-            for k in range(memory_mdp.n_states):
-                # If the next possible state is not the current state
-                if k != i:
-                    coefficient = - gamma * memory_mdp.transition_probabilities[i, j, k]
-                # If the next possible is the current state
-                else:
-                    coefficient = 1 - gamma * memory_mdp.transition_probabilities[i, j, k]
-                coefficients.append(coefficient)
 
-            # TODO: It may become necessary to avoid giving CPLEX 0 coefficients altogether.
-            # Append linear constraint
-            lin_expr.append([variables, coefficients])
+def __set_constraints(c, constraint_matrix, rhs, sense):
+    # Each constraint only refers to its nonzero coefficients
+    indptr = constraint_matrix.indptr
+    indices = constraint_matrix.indices.tolist()
+    data = constraint_matrix.data.tolist()
 
-            # The constraint's right-hand side is simply the reward
-            rhs.append(float(memory_mdp.rewards[i, j]))
+    lin_expr = [[indices[indptr[row]:indptr[row + 1]], data[indptr[row]:indptr[row + 1]]] for row in range(constraint_matrix.shape[0])]
 
     # Add all linear constraints to CPLEX at once
-    program.linear_constraints.add(lin_expr=lin_expr, rhs=rhs, senses=["G"] * len(rhs))
+    c.linear_constraints.add(lin_expr=lin_expr, rhs=rhs.tolist(), senses=[sense] * len(rhs))
+
+
+def __set_algorithm(c, algorithm):
+    assert algorithm in CPLEX_ALGORITHMS
+    c.parameters.lpmethod.set(getattr(c.parameters.lpmethod.values, CPLEX_ALGORITHMS[algorithm]))
+
+
+def create_cplex_program(objective, constraint_matrix, rhs, sense='G', maximize=False, algorithm='auto', bounds=(0, None)):
+    # CPLEX is only imported when it is used so that the other backends work on machines without it
+    import cplex
+
+    c = cplex.Cplex()
+
+    __set_variables(c, len(objective), bounds)
+    __set_objective(c, objective, maximize)
+    __set_constraints(c, constraint_matrix, rhs, sense)
+    __set_algorithm(c, algorithm)
+
+    return c
+
+
+def solve_cplex_program(c, quiet=False, metrics=None):
+    if quiet:
+        c.set_log_stream(None)
+        c.set_results_stream(None)
+        c.set_warning_stream(None)
+    else:
+        print("===== Program Details =============================================")
+        print("{} variables".format(c.variables.get_num()))
+        print("{} sense".format(c.objective.sense[c.objective.get_sense()]))
+        print("{} linear coefficients".format(len(c.objective.get_linear())))
+        print("{} linear constraints".format(c.linear_constraints.get_num()))
+
+        print("===== CPLEX Details ===============================================")
+
+    c.solve()
+
+    if not quiet:
+        print("===================================================================")
+
+    if metrics is not None:
+        metrics['iterations'] = c.solution.progress.get_num_iterations()
+        metrics['status'] = c.solution.get_status_string()
+
+    return c.solution.get_objective_value(), c.solution.get_values(), c.solution.get_dual_values()
+
+
+def solve_lp_with_cplex(objective, constraint_matrix, rhs, sense='G', maximize=False, algorithm='auto', quiet=False, metrics=None, bounds=(0, None)):
+    return solve_cplex_program(create_cplex_program(objective, constraint_matrix, rhs, sense, maximize, algorithm, bounds), quiet, metrics)
+
+
+def solve_lp_with_highs(objective, constraint_matrix, rhs, sense='G', maximize=False, algorithm='auto', quiet=False, metrics=None, bounds=(0, None)):
+    from scipy.optimize import linprog
+
+    assert algorithm in HIGHS_ALGORITHMS
+
+    # SciPy only minimizes and only accepts <= and = constraints
+    sign = -1 if maximize else 1
+    if sense == 'G':
+        result = linprog(sign * objective, A_ub=-constraint_matrix, b_ub=-rhs, bounds=bounds, method=HIGHS_ALGORITHMS[algorithm])
+        marginals = -result.ineqlin.marginals if result.success else None
+    else:
+        result = linprog(sign * objective, A_eq=constraint_matrix, b_eq=rhs, bounds=bounds, method=HIGHS_ALGORITHMS[algorithm])
+        marginals = result.eqlin.marginals if result.success else None
+
+    if metrics is not None:
+        metrics['iterations'] = int(result.nit)
+        metrics['status'] = result.message
+
+    assert result.success, result.message
+
+    return sign * result.fun, result.x.tolist(), (sign * marginals).tolist()
+
+
+# Each LP backend optimizes objective . x subject to constraint_matrix x >= rhs (sense 'G') or constraint_matrix x = rhs (sense 'E')
+# and lower <= x <= upper for bounds=(lower, upper) with None for an unbounded side, and returns the objective value, the variable
+# values, and the dual values of the constraints (a quiet backend prints nothing and a backend given a metrics dict records its
+# iteration count and solve status in it)
+LP_BACKENDS = {
+    'cplex': solve_lp_with_cplex,
+    'highs': solve_lp_with_highs
+}
+
+
+def register_lp_backend(name, lp_solver):
+    LP_BACKENDS[name] = lp_solver
+
+
+def __measure(metrics, phase, function, *arguments):
+    start_time = time.perf_counter()
+    result = function(*arguments)
+    metrics['phases'][phase] = time.perf_counter() - start_time
+    return result
 
 
 def __get_policy(values, memory_mdp, gamma):
-    policy = []
+    return np.argmax(memory_mdp.get_action_values(values, gamma), axis=1).tolist()
 
-    for i in range(memory_mdp.n_states):
-        best_action, best_action_value = None, None
 
-        for j in range(memory_mdp.n_actions):
-            action_value = memory_mdp.rewards[i, j] + gamma * np.sum(memory_mdp.transition_probabilities[i, j] * values)
-            if best_action_value is None or action_value > best_action_value:
-                best_action = j
-                best_action_value = action_value
+def __set_model_size(metrics, constraint_matrix):
+    metrics['n_variables'] = constraint_matrix.shape[1]
+    metrics['n_constraints'] = constraint_matrix.shape[0]
+    metrics['n_nonzeros'] = int(constraint_matrix.nnz)
 
-        policy.append(best_action)
 
-    return policy
+def __solve_primal_linear_program_in_blocks(memory_mdp, gamma, algorithm, quiet, metrics, block_size):
+    rhs = memory_mdp.rewards.reshape(-1)
 
+    def create_program():
+        c = create_cplex_program(memory_mdp.start_state_probabilities, sp.csr_matrix((0, memory_mdp.n_states)), np.zeros(0), algorithm=algorithm, bounds=VALUE_BOUNDS)
 
-def solve(mdp, gamma):
-    memory_mdp = MemoryMDP(mdp)
+        # Only one block of (state, action) rows exists outside of CPLEX at any time
+        n_nonzeros = 0
+        for start in range(0, len(rhs), block_size):
+            constraint_block = memory_mdp.get_constraint_matrix(gamma, start, start + block_size)
+            __set_constraints(c, constraint_block, rhs[start:start + block_size], 'G')
+            n_nonzeros += constraint_block.nnz
 
-    __validate(memory_mdp)
+        metrics['n_variables'] = memory_mdp.n_states
+        metrics['n_constraints'] = len(rhs)
+        metrics['n_nonzeros'] = n_nonzeros
 
-    c = cplex.Cplex()
+        return c
 
-    __set_variables(c, memory_mdp)
-    __set_objective(c, memory_mdp)
-    __set_constraints(c, memory_mdp, gamma)
+    c = __measure(metrics, 'constraint_assembly', create_program)
 
-    print("===== Program Details =============================================")
-    print("{} variables".format(c.variables.get_num()))
-    print("{} sense".format(c.objective.sense[c.objective.get_sense()]))
-    print("{} linear coefficients".format(len(c.objective.get_linear())))
-    print("{} linear constraints".format(c.linear_constraints.get_num()))
+    objective_value, values, _ = __measure(metrics, 'solve', solve_cplex_program, c, quiet, metrics)
+    policy = __measure(metrics, 'policy_extraction', __get_policy, values, memory_mdp, gamma)
+
+    return objective_value, values, policy
+
+
+def __solve_primal_linear_program(memory_mdp, gamma, backend, algorithm, quiet, metrics):
+    # There is one constraint (I - gamma P) v >= R for each (state, action) pair
+    constraint_matrix = __measure(metrics, 'constraint_assembly', memory_mdp.get_constraint_matrix, gamma)
+    __set_model_size(metrics, constraint_matrix)
+
+    # The constraint's right-hand side is simply the reward
+    rhs = memory_mdp.rewards.reshape(-1)
+
+    objective_value, values, _ = __measure(metrics, 'solve', lambda: LP_BACKENDS[backend](memory_mdp.start_state_probabilities, constraint_matrix, rhs, 'G', False, algorithm, quiet, metrics, bounds=VALUE_BOUNDS))
+    policy = __measure(metrics, 'policy_extraction', __get_policy, values, memory_mdp, gamma)
+
+    return objective_value, values, policy
+
+
+def __solve_dual_linear_program(memory_mdp, gamma, backend, algorithm, quiet, metrics):
+    # There is one flow conservation constraint (I - gamma P)^T x = mu for each state over the occupancy x of each (state, action) pair
+    constraint_matrix = __measure(metrics, 'constraint_assembly', lambda: memory_mdp.get_constraint_matrix(gamma).transpose().tocsr())
+    __set_model_size(metrics, constraint_matrix)
+
+    objective_value, occupancies, values = __measure(metrics, 'solve', lambda: LP_BACKENDS[backend](memory_mdp.rewards.reshape(-1), constraint_matrix, memory_mdp.start_state_probabilities, 'E', True, algorithm, quiet, metrics, bounds=OCCUPANCY_BOUNDS))
+
+    # The values are the dual values of the flow conservation constraints and each state takes the action that it occupies the most
+    policy = __measure(metrics, 'policy_extraction', lambda: np.argmax(np.reshape(occupancies, (memory_mdp.n_states, memory_mdp.n_actions)), axis=1).tolist())
+
+    return objective_value, values, policy
+
+
+def __solve_linear_program(memory_mdp, gamma, backend, quiet, metrics, formulation='primal', algorithm='auto', block_size=None):
+    assert formulation in FORMULATIONS
+
+    # Streaming the constraints in blocks needs a solver that can take rows incrementally
+    if block_size is not None:
+        assert backend == 'cplex' and formulation == 'primal'
+        return __solve_primal_linear_program_in_blocks(memory_mdp, gamma, algorithm, quiet, metrics, block_size)
+
+    if formulation == 'dual':
+        return __solve_dual_linear_program(memory_mdp, gamma, backend, algorithm, quiet, metrics)
+
+    return __solve_primal_linear_program(memory_mdp, gamma, backend, algorithm, quiet, metrics)
+
+
+def __solve_iteratively(memory_mdp, gamma, backend, metrics, **options):
+    iterative_solver = getattr(iterative_mdp_solver, backend)
+
+    # Iterative backends extract their policy as they solve
+    values, policy = __measure(metrics, 'solve', lambda: iterative_solver(memory_mdp, gamma, metrics=metrics, **options))
+
+    objective_value = float(np.dot(memory_mdp.start_state_probabilities, values))
+
+    return objective_value, values.tolist(), policy.tolist()
+
+
+def __solve_memory_mdp(memory_mdp, gamma, backend, quiet, metrics, **options):
+    assert backend in LP_BACKENDS or backend in ITERATIVE_BACKENDS
+
+    metrics['backend'] = backend
+    metrics['n_states'] = memory_mdp.n_states
+    metrics['n_actions'] = memory_mdp.n_actions
+    metrics['n_transitions'] = int(memory_mdp.get_transition_matrix().nnz)
+
+    if backend in LP_BACKENDS:
+        return __solve_linear_program(memory_mdp, gamma, backend, quiet, metrics, **options)
+
+    return __solve_iteratively(memory_mdp, gamma, backend, metrics, **options)
+
+
+def __get_component_levels(memory_mdp):
+    state_graph = memory_mdp.get_state_graph().tocoo()
+    n_components, components = connected_components(state_graph, directed=True, connection='strong')
+
+    # Component c has an edge to component d if a state of c can lead to a state of d
+    is_crossing = components[state_graph.row] != components[state_graph.col]
+    component_graph = sp.csr_matrix((
+        np.ones(np.count_nonzero(is_crossing)),
+        (components[state_graph.row[is_crossing]], components[state_graph.col[is_crossing]])
+    ), shape=(n_components, n_components))
+    component_graph.sum_duplicates()
+    component_graph.data[:] = 1
+    component_graph = component_graph.tocsc()
+
+    # Each level only holds components whose successors are all in earlier levels so the components of a level are independent
+    levels = []
+    out_degrees = np.asarray(component_graph.sum(axis=1)).reshape(-1)
+    is_done = np.zeros(n_components, dtype=bool)
+    frontier = np.flatnonzero(out_degrees == 0)
+    while len(frontier):
+        levels.append(frontier)
+        is_done[frontier] = True
+        out_degrees -= np.asarray(component_graph[:, frontier].sum(axis=1)).reshape(-1).astype(int)
+        frontier = np.flatnonzero((out_degrees == 0) & ~is_done)
+
+    return components, levels
+
+
+def __solve_singleton_components(memory_mdp, transition_matrix, gamma, states, values, policy):
+    rows = memory_mdp.get_rows(states)
+
+    # A state whose successors are all solved except for itself has V = max_a (R(s, a) + gamma sum_s' P(s' | s, a) V(s')) / (1 - gamma P(s | s, a))
+    rewards = memory_mdp.rewards[states] + gamma * (transition_matrix[rows] @ values).reshape(len(states), memory_mdp.n_actions)
+    self_probabilities = np.asarray(transition_matrix[rows, np.repeat(states, memory_mdp.n_actions)]).reshape(len(states), memory_mdp.n_actions)
+    action_values = rewards / (1 - gamma * self_probabilities)
+
+    policy[states] = np.argmax(action_values, axis=1)
+    values[states] = np.max(action_values, axis=1)
 
-    print("===== CPLEX Details ===============================================")
-    c.solve()
-    print("===================================================================")
 
-    objective_value = c.solution.get_objective_value()
-    values = c.solution.get_values()
-    policy = __get_policy(values, memory_mdp, gamma)
+def __get_component_arrays(memory_mdp, transition_matrix, gamma, states, values):
+    rows = memory_mdp.get_rows(states)
+    component_transition_matrix = transition_matrix[rows]
 
+    # The values of the downstream components are already fixed so they become part of the rewards (the component's own states still have a value of 0)
+    rewards = memory_mdp.rewards[states] + gamma * (component_transition_matrix @ values).reshape(len(states), memory_mdp.n_actions)
+
+    # Every state is weighted in the objective so that each one gets its optimal value rather than only the states in the start distribution
+    return rewards, component_transition_matrix[:, states].tocsr(), np.ones(len(states))
+
+
+def __solve_topologically(memory_mdp, gamma, backend, quiet, metrics, workers=None, **options):
+    metrics['backend'] = backend
+    metrics['n_states'] = memory_mdp.n_states
+    metrics['n_actions'] = memory_mdp.n_actions
+
+    transition_matrix = memory_mdp.get_transition_matrix()
+    metrics['n_transitions'] = int(transition_matrix.nnz)
+
+    components, levels = __measure(metrics, 'decomposition', __get_component_levels, memory_mdp)
+    metrics['n_components'] = int(components.max()) + 1 if memory_mdp.n_states else 0
+    metrics['n_levels'] = len(levels)
+
+    component_states = np.split(np.argsort(components, kind='stable'), np.cumsum(np.bincount(components))[:-1])
+
+    values = np.zeros(memory_mdp.n_states)
+    policy = np.zeros(memory_mdp.n_states, dtype=int)
+
+    def solve_levels(executor):
+        iterations = 0
+
+        for level in levels:
+            # Components with a single state are solved in closed form all at once
+            is_singleton = np.array([len(component_states[component]) == 1 for component in level])
+            singleton_states = np.array([component_states[component][0] for component in level[is_singleton]], dtype=int)
+            if len(singleton_states):
+                __solve_singleton_components(memory_mdp, transition_matrix, gamma, singleton_states, values, policy)
+
+            results = []
+            for component in level[~is_singleton]:
+                states = component_states[component]
+                arrays = __get_component_arrays(memory_mdp, transition_matrix, gamma, states, values)
+                if executor is None:
+                    results.append((states, __solve_arrays(*arrays, gamma, backend, quiet, options)))
+                else:
+                    results.append((states, executor.submit(__solve_arrays, *arrays, gamma, backend, quiet, options)))
+
+            for states, result in results:
+                _, component_values, component_policy, component_metrics = result if executor is None else result.result()
+                values[states] = component_values
+                policy[states] = component_policy
+                iterations += component_metrics.get('iterations', 0)
+
+        metrics['iterations'] = iterations
+
+    def solve_all_levels():
+        if workers is None:
+            solve_levels(None)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                solve_levels(executor)
+
+    __measure(metrics, 'solve', solve_all_levels)
+
+    objective_value = float(np.dot(memory_mdp.start_state_probabilities, values))
+
+    return objective_value, values.tolist(), policy.tolist()
+
+
+def __get_solution(memory_mdp, objective_value, values, policy):
     return {
         'objective_value': objective_value,
         'values': {memory_mdp.states[state]: value for state, value in enumerate(values)},
         'policy': {memory_mdp.states[state]: memory_mdp.actions[action] for state, action in enumerate(policy)}
     }
+
+
+def compile_mdp(mdp, cache=None):
+    # An MDP that has already been compiled is solved as is
+    if isinstance(mdp, MemoryMDP):
+        return mdp
+    if cache is not None:
+        return cache.get(mdp)
+    return MemoryMDP(mdp)
+
+
+def __create_metrics():
+    return {'phases': {}}
+
+
+def solve(mdp, gamma, backend='cplex', include_action_values=False, cache=None, quiet=False, callback=None, prune_unreachable=False, topological=False, validate=True, **options):
+    metrics = __create_metrics()
+
+    memory_mdp = __measure(metrics, 'compilation', compile_mdp, mdp, cache)
+
+    __measure(metrics, 'validation', __validate, memory_mdp, validate)
+
+    # Only the states that can be reached from the start distribution are solved for when pruning
+    reduced_memory_mdp, reachable_states = memory_mdp, None
+    if prune_unreachable:
+        reachable_states = __measure(metrics, 'pruning', memory_mdp.get_reachable_states)
+        reduced_memory_mdp = memory_mdp.restrict(reachable_states)
+        metrics['n_excluded_states'] = memory_mdp.n_states - reduced_memory_mdp.n_states
+
+    # Topological solving goes through the strongly connected components of the state graph from the last one to the first
+    if topological:
+        objective_value, values, policy = __solve_topologically(reduced_memory_mdp, gamma, backend, quiet, metrics, **options)
+    else:
+        objective_value, values, policy = __solve_memory_mdp(reduced_memory_mdp, gamma, backend, quiet, metrics, **options)
+
+    solution = __get_solution(reduced_memory_mdp, objective_value, values, policy)
+
+    if prune_unreachable:
+        is_excluded = np.ones(memory_mdp.n_states, dtype=bool)
+        is_excluded[reachable_states] = False
+        solution['excluded_states'] = [memory_mdp.states[state] for state in np.flatnonzero(is_excluded)]
+
+    # The (n_states, n_actions) Q-table is indexed in the order of mdp.states() and mdp.actions() and is NaN for excluded states
+    if include_action_values:
+        if prune_unreachable:
+            solution['action_values'] = np.full((memory_mdp.n_states, memory_mdp.n_actions), np.nan)
+            solution['action_values'][reachable_states] = reduced_memory_mdp.get_action_values(values, gamma)
+        else:
+            solution['action_values'] = memory_mdp.get_action_values(values, gamma)
+
+    # The callback receives the phase timings, the model size, the iteration count, and the solve status
+    if callback is not None:
+        callback(metrics)
+
+    return solution
+
+
+def compare(mdp, gamma, backends=('cplex', 'highs'), quiet=False, **options):
+    memory_mdp = MemoryMDP(mdp)
+
+    __validate(memory_mdp)
+
+    report = {}
+    reference_values, reference_policy = None, None
+
+    for backend in backends:
+        metrics = __create_metrics()
+
+        start_time = time.perf_counter()
+        objective_value, values, policy = __solve_memory_mdp(memory_mdp, gamma, backend, quiet, metrics, **options)
+        duration = time.perf_counter() - start_time
+
+        # Every backend is measured against the first one
+        if reference_values is None:
+            reference_values, reference_policy = np.array(values), np.array(policy)
+
+        report[backend] = {
+            'time': duration,
+            'objective_value': objective_value,
+            'max_value_difference': float(np.max(np.abs(np.array(values) - reference_values))),
+            'policy_agreement': float(np.mean(np.array(policy) == reference_policy)),
+            'iterations': metrics.get('iterations'),
+            'status': metrics.get('status')
+        }
+
+    return report
+
+
+def __get_sampled_rows(memory_mdp, n_samples, seed):
+    n_rows = memory_mdp.n_states * memory_mdp.n_actions
+    if n_samples is None or n_samples >= n_rows:
+        return np.arange(n_rows)
+
+    # Each constraint is kept for a (state, action) pair that is sampled uniformly without replacement
+    return np.sort(np.random.default_rng(seed).choice(n_rows, size=n_samples, replace=False))
+
+
+def __get_approximate_constraint_matrix(memory_mdp, gamma, features, rows):
+    # Row (state * n_actions + action) of (Phi - gamma P Phi) w >= R only involves the features of the state and of its successors
+    constraint_matrix = (sp.csr_matrix(features[rows // memory_mdp.n_actions]) - gamma * sp.csr_matrix(memory_mdp.get_transition_matrix()[rows] @ features)).tocsr()
+    constraint_matrix.eliminate_zeros()
+
+    return constraint_matrix, memory_mdp.rewards.reshape(-1)[rows]
+
+
+def __solve_approximate_linear_program(memory_mdp, gamma, features, backend, algorithm, quiet, metrics, n_samples, seed, weight_bound, state_relevance_weights):
+    rows = __measure(metrics, 'sampling', __get_sampled_rows, memory_mdp, n_samples, seed)
+
+    constraint_matrix, rhs = __measure(metrics, 'constraint_assembly', __get_approximate_constraint_matrix, memory_mdp, gamma, features, rows)
+    __set_model_size(metrics, constraint_matrix)
+    metrics['n_features'] = features.shape[1]
+
+    # The objective mu . Phi w weighs the approximate values by the state relevance weights
+    objective = np.asarray(features.T @ state_relevance_weights).reshape(-1)
+
+    # The weights are free unless they are bounded, which keeps a program with too few sampled constraints from being unbounded
+    bounds = VALUE_BOUNDS if weight_bound is None else (-float(weight_bound), float(weight_bound))
+
+    _, weights, _ = __measure(metrics, 'solve', lambda: LP_BACKENDS[backend](objective, constraint_matrix, rhs, 'G', False, algorithm, quiet, metrics, bounds=bounds))
+    weights = np.array(weights)
+
+    values = np.asarray(features @ weights).reshape(-1)
+    policy = __measure(metrics, 'policy_extraction', __get_policy, values, memory_mdp, gamma)
+
+    return float(np.dot(memory_mdp.start_state_probabilities, values)), weights, values, policy
+
+
+def solve_approximately(mdp, gamma, features=None, backend='cplex', n_samples=None, seed=None, weight_bound=None, state_relevance_weights=None, cache=None, quiet=False, callback=None, validate=True, algorithm='auto'):
+    assert backend in LP_BACKENDS
+
+    metrics = __create_metrics()
+    metrics['backend'] = backend
+
+    memory_mdp = __measure(metrics, 'compilation', compile_mdp, mdp, cache)
+
+    __measure(metrics, 'validation', __validate, memory_mdp, validate)
+
+    # The values are approximated as V = Phi w with an (n_states, n_features) feature matrix that defaults to the features of the MDP
+    if features is None:
+        assert hasattr(mdp, 'features'), "{} has no features() method so solve_approximately needs a features matrix".format(type(mdp).__name__)
+        features = mdp.features()
+    assert features.shape[0] == memory_mdp.n_states
+
+    if state_relevance_weights is None:
+        state_relevance_weights = memory_mdp.start_state_probabilities
+
+    metrics['n_states'] = memory_mdp.n_states
+    metrics['n_actions'] = memory_mdp.n_actions
+    metrics['n_transitions'] = int(memory_mdp.get_transition_matrix().nnz)
+
+    objective_value, weights, values, policy = __solve_approximate_linear_program(memory_mdp, gamma, features, backend, algorithm, quiet, metrics, n_samples, seed, weight_bound, state_relevance_weights)
+
+    solution = __get_solution(memory_mdp, objective_value, values, policy)
+    solution['weights'] = weights.tolist()
+
+    if callback is not None:
+        callback(metrics)
+
+    return solution
+
+
+def __solve_arrays(rewards, transition_matrix, start_state_probabilities, gamma, backend, quiet, options):
+    # Workers only receive arrays so the state and action labels are replaced with their indices
+    n_states, n_actions = rewards.shape
+    memory_mdp = MemoryMDP.from_arrays(list(range(n_states)), list(range(n_actions)), rewards, transition_matrix, start_state_probabilities)
+
+    metrics = __create_metrics()
+    objective_value, values, policy = __solve_memory_mdp(memory_mdp, gamma, backend, quiet, metrics, **options)
+
+    return objective_value, values, policy, metrics
+
+
+def solve_many(mdps, gamma, workers=None, backend='cplex', cache=None, quiet=False, callback=None, validate=True, **options):
+    # Yields (index, solution) pairs in the order in which the MDPs finish solving
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        memory_mdps = {}
+
+        # Each MDP is compiled in this process and submitted as soon as it is ready so that the workers can start early
+        for index, mdp in enumerate(mdps):
+            start_time = time.perf_counter()
+            memory_mdp = compile_mdp(mdp, cache)
+            compilation_time = time.perf_counter() - start_time
+
+            __validate(memory_mdp, validate)
+
+            future = executor.submit(__solve_arrays, memory_mdp.rewards, memory_mdp.get_transition_matrix(), memory_mdp.start_state_probabilities, gamma, backend, quiet, options)
+            memory_mdps[future] = (index, memory_mdp, compilation_time)
+
+        for future in as_completed(memory_mdps):
+            index, memory_mdp, compilation_time = memory_mdps.pop(future)
+            objective_value, values, policy, metrics = future.result()
+
+            if callback is not None:
+                metrics['index'] = index
+                metrics['phases']['compilation'] = compilation_time
+                callback(metrics)
+
+            yield index, __get_solution(memory_mdp, objective_value, values, policy)
@@ -0,0 +1,154 @@
+import numpy as np
+import scipy.sparse as sp
+
+import cplex_mdp_solver
+from cplex_mdp_solver import MemoryMDP
+
+
+class CplexSolverSession:
+    def __init__(self, mdp, gamma, algorithm='auto', quiet=False):
+        self.memory_mdp = self.__compile(mdp)
+        self.gamma = gamma
+        self.quiet = quiet
+
+        self.state_indices = {state: index for index, state in enumerate(self.memory_mdp.states)}
+        self.action_indices = {action: index for index, action in enumerate(self.memory_mdp.actions)}
+
+        # Successor rows that have been replaced since the last solve keyed by their (state * n_actions + action) row
+        self.pending_successors = {}
+
+        # Only the rewards and start state probabilities that were set since the last solve are sent to CPLEX again
+        self.changed_rows = set()
+        self.changed_states = set()
+        self.is_replaced = False
+
+        # The gamma and transitions that the program's coefficients were built from tell which coefficients are out of date
+        self.program_gamma = gamma
+        self.program_transition_matrix = self.memory_mdp.transition_probabilities
+
+        self.program = cplex_mdp_solver.create_cplex_program(self.memory_mdp.start_state_probabilities, self.memory_mdp.get_constraint_matrix(gamma), self.memory_mdp.rewards.reshape(-1), algorithm=algorithm, bounds=cplex_mdp_solver.VALUE_BOUNDS)
+
+        # Each re-solve starts from the optimal basis of the previous solve
+        self.program.parameters.advance.set(1)
+
+    def __compile(self, mdp):
+        memory_mdp = MemoryMDP(mdp)
+
+        # Rows are replaced in place so the transitions are always kept as a sparse (S * A, S) matrix
+        memory_mdp.transition_probabilities = memory_mdp.get_transition_matrix()
+        memory_mdp.is_sparse = True
+
+        return memory_mdp
+
+    def __get_row(self, state, action):
+        return self.state_indices[state] * self.memory_mdp.n_actions + self.action_indices[action]
+
+    def set_reward(self, state, action, reward):
+        self.memory_mdp.rewards[self.state_indices[state], self.action_indices[action]] = reward
+        self.changed_rows.add(self.__get_row(state, action))
+
+    def set_start_state_probabilities(self, start_state_probabilities):
+        # Only the states in the {state: probability} dictionary change
+        for state, probability in start_state_probabilities.items():
+            self.memory_mdp.start_state_probabilities[self.state_indices[state]] = probability
+            self.changed_states.add(self.state_indices[state])
+
+    def set_successors(self, state, action, successors):
+        successor_indices = [self.state_indices[successor_state] for successor_state, _ in successors]
+        probabilities = [probability for _, probability in successors]
+        self.pending_successors[self.__get_row(state, action)] = (successor_indices, probabilities)
+
+    def set_gamma(self, gamma):
+        self.gamma = gamma
+
+    def update(self, mdp):
+        memory_mdp = self.__compile(mdp)
+
+        assert memory_mdp.states == self.memory_mdp.states
+        assert memory_mdp.actions == self.memory_mdp.actions
+
+        self.memory_mdp = memory_mdp
+        self.pending_successors = {}
+        self.is_replaced = True
+
+    def __apply_pending_successors(self):
+        if not self.pending_successors:
+            return
+
+        shape = self.memory_mdp.transition_probabilities.shape
+
+        rows = np.array(list(self.pending_successors.keys()))
+        mask = np.ones(shape[0])
+        mask[rows] = 0
+
+        replacement_rows, replacement_columns, replacement_probabilities = [], [], []
+        for row, (successor_indices, probabilities) in self.pending_successors.items():
+            replacement_rows.extend([row] * len(successor_indices))
+            replacement_columns.extend(successor_indices)
+            replacement_probabilities.extend(probabilities)
+
+        replacement = sp.csr_matrix((replacement_probabilities, (replacement_rows, replacement_columns)), shape=shape)
+
+        transition_probabilities = (sp.diags(mask) @ self.memory_mdp.transition_probabilities + replacement).tocsr()
+        transition_probabilities.eliminate_zeros()
+        transition_probabilities.sort_indices()
+
+        self.memory_mdp.transition_probabilities = transition_probabilities
+        self.pending_successors = {}
+
+    def __get_constraint_rows(self, transition_matrix, gamma, rows):
+        return (self.memory_mdp.get_state_indicator(rows) - gamma * transition_matrix[rows]).tocsr()
+
+    def __synchronize(self):
+        all_rows = np.arange(self.memory_mdp.n_states * self.memory_mdp.n_actions)
+
+        # A new gamma changes every row while new successors only change their own rows
+        if self.is_replaced or self.gamma != self.program_gamma:
+            coefficient_rows = all_rows
+        else:
+            coefficient_rows = np.array(sorted(self.pending_successors), dtype=int)
+
+        self.__apply_pending_successors()
+
+        if self.is_replaced:
+            states, rows = np.arange(self.memory_mdp.n_states), all_rows
+        else:
+            states, rows = np.array(sorted(self.changed_states), dtype=int), np.array(sorted(self.changed_rows), dtype=int)
+
+        if len(states):
+            objective = self.memory_mdp.start_state_probabilities
+            self.program.objective.set_linear([(int(i), float(objective[i])) for i in states])
+
+        if len(rows):
+            rhs = self.memory_mdp.rewards.reshape(-1)
+            self.program.linear_constraints.set_rhs([(int(i), float(rhs[i])) for i in rows])
+
+        # Only the coefficients that differ from the program are sent to CPLEX (a coefficient of 0 removes the entry)
+        if len(coefficient_rows):
+            program_rows = self.__get_constraint_rows(self.program_transition_matrix, self.program_gamma, coefficient_rows)
+            constraint_rows = self.__get_constraint_rows(self.memory_mdp.transition_probabilities, self.gamma, coefficient_rows)
+
+            difference = (constraint_rows - program_rows).tocoo()
+            difference.eliminate_zeros()
+            if difference.nnz:
+                coefficients = np.asarray(constraint_rows[difference.row, difference.col]).reshape(-1)
+                self.program.linear_constraints.set_coefficients(list(zip(coefficient_rows[difference.row].tolist(), difference.col.tolist(), coefficients.tolist())))
+
+        self.changed_rows = set()
+        self.changed_states = set()
+        self.is_replaced = False
+
+        self.program_gamma = self.gamma
+        self.program_transition_matrix = self.memory_mdp.transition_probabilities
+
+    def solve(self):
+        self.__synchronize()
+
+        objective_value, values, _ = cplex_mdp_solver.solve_cplex_program(self.program, self.quiet)
+        policy = np.argmax(self.memory_mdp.get_action_values(values, self.gamma), axis=1)
+
+        return {
+            'objective_value': objective_value,
+            'values': {self.memory_mdp.states[state]: value for state, value in enumerate(values)},
+            'policy': {self.memory_mdp.states[state]: self.memory_mdp.actions[action] for state, action in enumerate(policy)}
+        }
@@ -1,102 +1,90 @@
+import numpy as np
+import scipy.sparse as sp
+
+HAS_PACKAGE_STATES = [True, False]
+
+
 class DeliveryMDP(object):
     def _get_state_record(self, state):
         components = state.split(':')
         return (components[0], components[1] == 'True')
 
+    def _get_state_index(self, location_index, has_package):
+        return location_index * len(HAS_PACKAGE_STATES) + HAS_PACKAGE_STATES.index(has_package)
+
     def _compute_states(self):
-        location_states = list(self.world_map['locations'])
-        has_package_states = [True, False]
-        return [location + ':' + str(has_package) for location in location_states for has_package in has_package_states]
+        return [location + ':' + str(has_package) for location in self.locations for has_package in HAS_PACKAGE_STATES]
 
     def _compute_actions(self):
-        return list(self.world_map['locations']) + ['PICKUP'] + ['DROPOFF']
-
-    def _compute_transition_probabilities(self):
-        transition_probabilities = {state: {action: {successor_state: 0.0 for successor_state in self.state_space} for action in self.action_space} for state in self.state_space}
-
-        for state in self.state_space:
-            for action in self.action_space:
-                for successor_state in self.state_space:
-                    state_record = self._get_state_record(state)
-                    successor_state_record = self._get_state_record(successor_state)
-
-                    if action == 'DROPOFF':
-                        if (state_record[0] == 'RBR' and not state_record[1]):
-                            print(successor_state)
-                            print(successor_state_record)
-                        if state_record[0] == self.dropoff_location and state_record[0] == successor_state_record[0] and state_record[1] and successor_state_record[1]:
-                            transition_probabilities[state][action][successor_state] = 1.0
-                            break
-
-                        if state_record[0] == self.dropoff_location and state_record[0] == successor_state_record[0] and not state_record[1] and not successor_state_record[1]:
-                            transition_probabilities[state][action][successor_state] = 1.0
-                            break
-
-                        if state_record[0] != self.dropoff_location and state_record[0] == successor_state_record[0] and not successor_state_record[1]:
-                            transition_probabilities[state][action][successor_state] = 1.0
-                            break
-
-                    if action == 'PICKUP':
-                        if state_record[0] == self.pickup_location and state_record[0] == successor_state_record[0]:
-                            transition_probabilities[state][action][successor_state] = 1.0
-                            break
-
-                        if state_record[0] != self.pickup_location and state_record[0] == successor_state_record[0] and state_record[1] == successor_state_record[1]:
-                            transition_probabilities[state][action][successor_state] = 1.0
-                            break
-
-                    if action in self.world_map['locations']:
-                        if (state_record[0] not in self.world_map['paths'] or action == state_record[0]) and state_record[0] == successor_state_record[0] and state_record[1] == successor_state_record[1]:
-                            transition_probabilities[state][action][successor_state] = 1.0
-                            break
-
-                        if state_record[0] in self.world_map['paths']:
-                            if action in self.world_map['paths'][state_record[0]] and successor_state_record[0] == action and state_record[1] == successor_state_record[1]:
-                                transition_probabilities[state][action][successor_state] = 1.0
-                                break
-
-                            if action not in self.world_map['paths'][state_record[0]] and state_record[0] == successor_state_record[0] and state_record[1] == successor_state_record[1]:
-                                transition_probabilities[state][action][successor_state] = 1.0
-                                break
-
-        return transition_probabilities
-
-    def _compute_rewards(self):
-        rewards = {state: {action: 0.0 for action in self.action_space} for state in self.state_space}
-
-        for state in self.state_space:
-            for action in self.action_space:
-                state_record = self._get_state_record(state)
-
-                if action == 'PICKUP':
-                    rewards[state][action] = -10
-
-                if action == 'DROPOFF':
-                    if state_record[0] == self.dropoff_location and state_record[1]:
-                        rewards[state][action] = 1000
-                    else:
-                        rewards[state][action] = -10
-
-                if action in self.world_map['locations']:
-                    if state_record[0] in self.world_map['paths'] and action in self.world_map['paths'][state_record[0]]:
-                        rewards[state][action] = -self.world_map['paths'][state_record[0]][action]['cost']
-                    else:
-                        rewards[state][action] = -1000
-
-        return rewards
+        return list(self.locations) + ['PICKUP'] + ['DROPOFF']
+
+    def _compute_adjacency(self):
+        # Maps each location index to the indices and costs of the locations it has a path to
+        adjacency = {location_index: {} for location_index in range(len(self.locations))}
+
+        for location, paths in self.world_map['paths'].items():
+            if location not in self.location_indices:
+                continue
+            for neighbor, path in paths.items():
+                if neighbor in self.location_indices:
+                    adjacency[self.location_indices[location]][self.location_indices[neighbor]] = path['cost']
+
+        return adjacency
+
+    def _compute_transitions_and_rewards(self):
+        n_states = len(self.state_space)
+        n_actions = len(self.action_space)
+
+        pickup_action = self.action_indices['PICKUP']
+        dropoff_action = self.action_indices['DROPOFF']
+
+        # Every transition is deterministic so each (state, action) pair only stores the index of its successor
+        successor_states = np.repeat(np.arange(n_states)[:, np.newaxis], n_actions, axis=1)
+        rewards = np.zeros(shape=(n_states, n_actions))
+
+        for location_index, location in enumerate(self.locations):
+            with_package = self._get_state_index(location_index, True)
+            without_package = self._get_state_index(location_index, False)
+
+            # Moving along a path costs its cost while any other move stays in place and costs 1000
+            rewards[[with_package, without_package], :len(self.locations)] = -1000
+            for neighbor_index, cost in self.adjacency[location_index].items():
+                successor_states[with_package, neighbor_index] = self._get_state_index(neighbor_index, True)
+                successor_states[without_package, neighbor_index] = self._get_state_index(neighbor_index, False)
+                rewards[[with_package, without_package], neighbor_index] = -cost
+
+            # Picking up the package only succeeds at the pickup location
+            rewards[[with_package, without_package], pickup_action] = -10
+            if location == self.pickup_location:
+                successor_states[without_package, pickup_action] = with_package
+
+            # Dropping off the package anywhere other than the dropoff location loses it
+            rewards[[with_package, without_package], dropoff_action] = -10
+            if location == self.dropoff_location:
+                rewards[with_package, dropoff_action] = 1000
+            else:
+                successor_states[with_package, dropoff_action] = without_package
+
+        return successor_states, rewards
 
     def _compute_start_state_probabilities(self):
-        return {state: 1.0 / len(self.state_space) for state in self.state_space}
+        return np.full(len(self.state_space), 1.0 / len(self.state_space))
 
     def __init__(self, world_map, pickup_location, dropoff_location):
         self.world_map = world_map
         self.pickup_location = pickup_location
         self.dropoff_location = dropoff_location
 
+        self.locations = list(self.world_map['locations'])
+        self.location_indices = {location: index for index, location in enumerate(self.locations)}
+        self.adjacency = self._compute_adjacency()
+
         self.state_space = self._compute_states()
         self.action_space = self._compute_actions()
-        self.transition_probabilities = self._compute_transition_probabilities()
-        self.rewards = self._compute_rewards()
+        self.state_indices = {state: index for index, state in enumerate(self.state_space)}
+        self.action_indices = {action: index for index, action in enumerate(self.action_space)}
+
+        self.successor_states, self.rewards = self._compute_transitions_and_rewards()
         self.start_state_probabilities = self._compute_start_state_probabilities()
 
     def states(self):
@@ -106,13 +94,45 @@ class DeliveryMDP(object):
         return self.action_space
 
     def transition_function(self, state, action, successor_state):
-        return self.transition_probabilities[state][action][successor_state]
+        return 1.0 if self.successor_states[self.state_indices[state], self.action_indices[action]] == self.state_indices[successor_state] else 0.0
+
+    def successors(self, state, action):
+        return [(self.state_space[self.successor_states[self.state_indices[state], self.action_indices[action]]], 1.0)]
 
     def reward_function(self, state, action):
-        return self.rewards[state][action]
+        return self.rewards[self.state_indices[state], self.action_indices[action]]
 
     def start_state_function(self, state):
-        return self.start_state_probabilities[state]
+        return self.start_state_probabilities[self.state_indices[state]]
+
+    def compile_arrays(self):
+        n_states, n_actions = self.rewards.shape
+
+        transition_probabilities = sp.csr_matrix((
+            np.ones(n_states * n_actions),
+            self.successor_states.reshape(-1),
+            np.arange(n_states * n_actions + 1)
+        ), shape=(n_states * n_actions, n_states))
+
+        return self.rewards.copy(), transition_probabilities, self.start_state_probabilities.copy()
+
+    def features(self):
+        n_locations = len(self.locations)
+        location_indices, package_indices = np.divmod(np.arange(len(self.state_space)), len(HAS_PACKAGE_STATES))
+
+        # Each state has an indicator feature for its location and one for whether it has the package
+        return sp.csr_matrix((
+            np.ones(2 * len(self.state_space)),
+            (np.repeat(np.arange(len(self.state_space)), 2), np.stack([location_indices, n_locations + package_indices], axis=1).reshape(-1))
+        ), shape=(len(self.state_space), n_locations + len(HAS_PACKAGE_STATES)))
+
+    def domain_definition(self):
+        return {
+            'world_map': self.world_map,
+            'pickup_location': self.pickup_location,
+            'dropoff_location': self.dropoff_location
+        }
 
     def is_goal(self, state):
-        return state[0] == self.dropoff_location and state[1]
+        location, has_package = self._get_state_record(state)
+        return location == self.dropoff_location and has_package
@@ -1,7 +1,19 @@
+import hashlib
 import math
 
+import numpy as np
+import scipy.sparse as sp
+from scipy.ndimage import distance_transform_cdt
+
 
 SLIP_PROBABILITY = 0.1
+
+# Cells are stored as the uint8 codes of their characters so that a grid takes one byte per cell
+OPEN = ord('O')
+WALL = ord('W')
+GOAL = ord('G')
+START = ord('S')
+
 ACTION_DETAILS = {
     'STAY': {
         'movement': [0, 0],
@@ -12,31 +24,67 @@ ACTION_DETAILS = {
     'NORTH': {
         'movement': [-1, 0],
         'slip_directions': ['EAST', 'WEST'],
-        'is_at_boundary': lambda row, column, grid_world: row == 0 or grid_world[row - 1][column] == 'W',
+        'is_at_boundary': lambda row, column, grid_world: row == 0 or get_cells(grid_world)[row - 1, column] == WALL,
         'is_valid_move': lambda row, successor_row, column, successor_column: row == successor_row + 1 and column == successor_column
     },
     'EAST': {
         'movement': [0, 1],
         'slip_directions': ['NORTH', 'SOUTH'],
-        'is_at_boundary': lambda row, column, grid_world: column == len(grid_world[row]) - 1 or grid_world[row][column + 1] == 'W',
+        'is_at_boundary': lambda row, column, grid_world: column == get_cells(grid_world).shape[1] - 1 or get_cells(grid_world)[row, column + 1] == WALL,
         'is_valid_move': lambda row, successor_row, column, successor_column: row == successor_row and column == successor_column - 1
     },
     'SOUTH': {
         'movement': [1, 0],
         'slip_directions': ['EAST', 'WEST'],
-        'is_at_boundary': lambda row, column, grid_world: row == len(grid_world) - 1 or grid_world[row + 1][column] == 'W',
+        'is_at_boundary': lambda row, column, grid_world: row == get_cells(grid_world).shape[0] - 1 or get_cells(grid_world)[row + 1, column] == WALL,
         'is_valid_move': lambda row, successor_row, column, successor_column: row == successor_row - 1 and column == successor_column
     },
     'WEST': {
         'movement': [0, -1],
         'slip_directions': ['NORTH', 'SOUTH'],
-        'is_at_boundary': lambda row, column, grid_world: column == 0 or grid_world[row][column - 1] == 'W',
+        'is_at_boundary': lambda row, column, grid_world: column == 0 or get_cells(grid_world)[row, column - 1] == WALL,
         'is_valid_move': lambda row, successor_row, column, successor_column: row == successor_row and column == successor_column + 1
     }
 }
 
 
+def get_cells(grid_world):
+    # A grid world is either a list of rows of one-character strings or a (height, width) uint8 array of their codes
+    if isinstance(grid_world, np.ndarray):
+        assert grid_world.dtype == np.uint8 and grid_world.ndim == 2
+        return grid_world
+
+    return np.array(grid_world, dtype='S1').view(np.uint8).reshape(len(grid_world), len(grid_world[0]))
+
+
+def save_grid_map(path, grid_world):
+    cells = get_cells(grid_world)
+
+    # The file is a binary PGM image whose gray levels are the cell codes
+    with open(path, 'wb') as file:
+        file.write('P5\n{} {}\n255\n'.format(cells.shape[1], cells.shape[0]).encode('ascii'))
+        file.write(np.ascontiguousarray(cells).tobytes())
+
+
+def load_grid_map(path, mode='r'):
+    tokens = []
+    with open(path, 'rb') as file:
+        # The magic number, width, height, and maximum gray level are followed by the cells in row-major order
+        while len(tokens) < 4:
+            line = file.readline()
+            assert line, "Truncated PGM header in {}".format(path)
+            tokens.extend(line.split(b'#')[0].split())
+        offset = file.tell()
+
+    assert tokens[0] == b'P5' and int(tokens[3]) <= 255, "{} is not a binary PGM file with one byte per cell".format(path)
+
+    # The cells are memory-mapped so that even a map with millions of cells is never read into memory as a whole
+    return np.memmap(path, dtype=np.uint8, mode=mode, offset=offset, shape=(int(tokens[2]), int(tokens[1])))
+
+
 def get_adjacent_cells(grid_world, row, column, action):
+    cells = get_cells(grid_world)
+
     adjacent_cells = []
 
     for slip_direction in ACTION_DETAILS[action]['slip_directions']:
@@ -45,9 +93,9 @@ def get_adjacent_cells(grid_world, row, column, action):
         adjacent_row = row + row_offset
         adjacent_column = column + column_offset
 
-        if 0 <= adjacent_row < len(grid_world) and 0 <= adjacent_column < len(grid_world[adjacent_row]):
-            adjacent_cell = grid_world[adjacent_row][adjacent_column]
-            if adjacent_cell != 'W':
+        if 0 <= adjacent_row < cells.shape[0] and 0 <= adjacent_column < cells.shape[1]:
+            adjacent_cell = cells[adjacent_row, adjacent_column]
+            if adjacent_cell != WALL:
                 adjacent_cells.append([adjacent_row, adjacent_column])
 
     return adjacent_cells
@@ -56,11 +104,13 @@ def get_adjacent_cells(grid_world, row, column, action):
 class GridWorldMDP:
     def __init__(self, grid_world):
         self.grid_world = grid_world
-        self.width = len(grid_world[0])
-        self.height = len(grid_world)
+        self.cells = get_cells(grid_world)
+        self.height, self.width = self.cells.shape
+        self.n_start_states = int(np.count_nonzero(self.cells != WALL))
 
     def states(self):
-        return list(range(self.width * self.height))
+        # A range stands in for the list of states so that a large map never holds one Python integer per cell
+        return range(self.width * self.height)
 
     def actions(self):
         return list(ACTION_DETAILS.keys())
@@ -72,12 +122,12 @@ class GridWorldMDP:
         successor_row = math.floor(successor_state / self.width)
         successor_column = successor_state - successor_row * self.width
 
-        if self.grid_world[row][column] == 'W':
+        if self.cells[row, column] == WALL:
             if row == successor_row and column == successor_column:
                 return 1
             return 0
 
-        adjacent_cells = get_adjacent_cells(self.grid_world, row, column, action)
+        adjacent_cells = get_adjacent_cells(self.cells, row, column, action)
         for adjacent_cell in adjacent_cells:
             adjacent_row, adjacent_column = adjacent_cell
             if adjacent_row == successor_row and adjacent_column == successor_column:
@@ -85,11 +135,11 @@ class GridWorldMDP:
 
         adjustment = SLIP_PROBABILITY if adjacent_cells else 0
 
-        is_at_boundary = ACTION_DETAILS[action]['is_at_boundary'](row, column, self.grid_world)
+        is_at_boundary = ACTION_DETAILS[action]['is_at_boundary'](row, column, self.cells)
         if row == successor_row and column == successor_column and is_at_boundary:
             return 1 - adjustment
 
-        if self.grid_world[successor_row][successor_column] == 'W':
+        if self.cells[successor_row, successor_column] == WALL:
             return 0
 
         is_valid_move = ACTION_DETAILS[action]['is_valid_move'](row, successor_row, column, successor_column)
@@ -98,23 +148,127 @@ class GridWorldMDP:
 
         return 0
 
-    def reward_function(self, state, action):
+    def successors(self, state, action):
         row = math.floor(state / self.width)
         column = state - row * self.width
 
-        cell = self.grid_world[row][column]
+        if self.cells[row, column] == WALL:
+            return [(state, 1)]
+
+        successors = []
+
+        adjacent_cells = get_adjacent_cells(self.cells, row, column, action)
+        for adjacent_row, adjacent_column in adjacent_cells:
+            successors.append((self.width * adjacent_row + adjacent_column, SLIP_PROBABILITY / len(adjacent_cells)))
+
+        adjustment = SLIP_PROBABILITY if adjacent_cells else 0
+
+        if ACTION_DETAILS[action]['is_at_boundary'](row, column, self.cells):
+            successors.append((state, 1 - adjustment))
+        else:
+            row_offset, column_offset = ACTION_DETAILS[action]['movement']
+            successors.append((self.width * (row + row_offset) + column + column_offset, 1 - adjustment))
+
+        return successors
+
+    def reward_function(self, state, action):
+        row = math.floor(state / self.width)
+        column = state - row * self.width
 
-        if cell == 'G' and action == 'STAY':
+        if self.cells[row, column] == GOAL and action == 'STAY':
             return 1
 
         return 0
 
     def start_state_function(self, state):
-        start_states = []
+        row = math.floor(state / self.width)
+        column = state - row * self.width
+
+        return 1.0 / self.n_start_states if self.cells[row, column] != WALL else 0
+
+    def compile_arrays(self):
+        actions = self.actions()
+
+        n_states = self.width * self.height
+        n_actions = len(actions)
+
+        is_wall = self.cells == WALL
+
+        # Cells outside of the grid are treated as walls
+        is_blocked = np.ones(shape=(self.height + 2, self.width + 2), dtype=bool)
+        is_blocked[1:-1, 1:-1] = is_wall
+
+        rows, columns = np.divmod(np.arange(n_states), self.width)
+        is_open = ~is_wall.reshape(-1)
+
+        def get_neighbors(direction):
+            row_offset, column_offset = ACTION_DETAILS[direction]['movement']
+            neighbor_rows, neighbor_columns = rows + row_offset, columns + column_offset
+            is_neighbor_open = ~is_blocked[neighbor_rows + 1, neighbor_columns + 1]
+            return np.where(is_neighbor_open, neighbor_rows * self.width + neighbor_columns, -1), is_neighbor_open
+
+        transition_rows, transition_columns, transition_data = [], [], []
+
+        def add_transitions(states, action, successor_states, probabilities):
+            transition_rows.append(states * n_actions + action)
+            transition_columns.append(successor_states)
+            transition_data.append(probabilities)
+
+        states = np.arange(n_states)
+        for action_index, action in enumerate(actions):
+            # Wall cells are absorbing
+            add_transitions(states[~is_open], action_index, states[~is_open], np.ones(np.count_nonzero(~is_open)))
+
+            slip_neighbors = [get_neighbors(slip_direction) for slip_direction in ACTION_DETAILS[action]['slip_directions']]
+            n_slips = sum(is_neighbor_open.astype(int) for _, is_neighbor_open in slip_neighbors) if slip_neighbors else np.zeros(n_states, dtype=int)
+
+            # The slip probability is split evenly between the open cells in the slip directions
+            for neighbors, is_neighbor_open in slip_neighbors:
+                is_slipping = is_open & is_neighbor_open
+                add_transitions(states[is_slipping], action_index, neighbors[is_slipping], SLIP_PROBABILITY / n_slips[is_slipping])
+
+            # The intended move stays in place at a boundary
+            adjustment = np.where(n_slips > 0, SLIP_PROBABILITY, 0)
+            if action == 'STAY':
+                successor_states = states
+            else:
+                neighbors, is_neighbor_open = get_neighbors(action)
+                successor_states = np.where(is_neighbor_open, neighbors, states)
+            add_transitions(states[is_open], action_index, successor_states[is_open], 1 - adjustment[is_open])
+
+        transition_probabilities = sp.csr_matrix((
+            np.concatenate(transition_data).astype(float),
+            (np.concatenate(transition_rows), np.concatenate(transition_columns))
+        ), shape=(n_states * n_actions, n_states))
+        transition_probabilities.sum_duplicates()
+
+        rewards = np.zeros(shape=(n_states, n_actions))
+        rewards[(self.cells == GOAL).reshape(-1), actions.index('STAY')] = 1
+
+        start_state_probabilities = np.where(is_open, 1.0 / self.n_start_states, 0)
+
+        return rewards, transition_probabilities, start_state_probabilities
+
+    def features(self):
+        is_wall = (self.cells == WALL).reshape(-1)
+        is_goal = (self.cells == GOAL).reshape(-1)
+
+        # The Manhattan distance to the nearest goal ignores walls and is scaled to [0, 1]
+        if np.any(is_goal):
+            distances = distance_transform_cdt(self.cells != GOAL, metric='taxicab').reshape(-1) / (self.height + self.width)
+        else:
+            distances = np.zeros(self.width * self.height)
 
-        for row in range(self.height):
-            for column in range(self.width):
-                if self.grid_world[row][column] != 'W':
-                    start_states.append(self.width * row + column)
+        # Wall cells only have their own indicator so that their values are fit independently of the open cells
+        is_open = ~is_wall
+        return np.stack([is_open, is_wall, is_goal, is_open * distances, is_open * distances ** 2], axis=1).astype(float)
 
-        return 1.0 / len(start_states) if state in start_states else 0
+    def domain_definition(self):
+        # The cells are hashed rather than listed so that a list and an array of the same grid share a definition
+        return {
+            'grid_world': {
+                'shape': list(self.cells.shape),
+                'sha256': hashlib.sha256(np.ascontiguousarray(self.cells).tobytes()).hexdigest()
+            },
+            'slip_probability': SLIP_PROBABILITY
+        }
@@ -0,0 +1,117 @@
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+
+
+EVALUATION_METHODS = ['direct', 'iterative']
+
+
+def get_policy_transition_matrix(memory_mdp, policy):
+    # Selects row (state * n_actions + policy[state]) for every state
+    return memory_mdp.get_transition_matrix()[np.arange(memory_mdp.n_states) * memory_mdp.n_actions + policy]
+
+
+def evaluate(memory_mdp, gamma, policy, method='direct', tolerance=1e-10, max_iterations=10000):
+    assert method in EVALUATION_METHODS
+
+    # The values of a fixed policy are the solution of (I - gamma P_pi) V = R_pi
+    system_matrix = (sp.identity(memory_mdp.n_states, format='csc') - gamma * get_policy_transition_matrix(memory_mdp, policy)).tocsc()
+    policy_rewards = memory_mdp.rewards[np.arange(memory_mdp.n_states), policy]
+
+    if method == 'direct':
+        return spla.spsolve(system_matrix, policy_rewards)
+
+    # BiCGSTAB only needs matrix-vector products so it also works when a factorization does not fit in memory
+    values, info = spla.bicgstab(system_matrix, policy_rewards, rtol=tolerance, maxiter=max_iterations)
+    assert info == 0, "BiCGSTAB did not converge within {} iterations".format(max_iterations)
+
+    return values
+
+
+def __improve_policy(policy, action_values, tolerance):
+    states = np.arange(len(policy))
+    greedy_policy = np.argmax(action_values, axis=1)
+
+    # Only switch actions that are strictly better so that ties cannot make the policy cycle
+    is_improved = action_values[states, greedy_policy] > action_values[states, policy] + tolerance
+
+    return np.where(is_improved, greedy_policy, policy), np.any(is_improved)
+
+
+def __set_convergence(metrics, iterations, has_converged):
+    if metrics is not None:
+        metrics['iterations'] = iterations
+        metrics['status'] = 'converged' if has_converged else 'iteration limit'
+
+
+def value_iteration(memory_mdp, gamma, tolerance=1e-6, max_iterations=100000, metrics=None):
+    values = np.zeros(memory_mdp.n_states)
+
+    iterations, has_converged = 0, False
+    while iterations < max_iterations and not has_converged:
+        new_values = np.max(memory_mdp.get_action_values(values, gamma), axis=1)
+        residual = np.max(np.abs(new_values - values))
+        values = new_values
+
+        iterations += 1
+        has_converged = residual < tolerance
+
+    __set_convergence(metrics, iterations, has_converged)
+
+    policy = np.argmax(memory_mdp.get_action_values(values, gamma), axis=1)
+
+    return values, policy
+
+
+def policy_iteration(memory_mdp, gamma, tolerance=1e-9, max_iterations=1000, metrics=None):
+    policy = np.argmax(memory_mdp.rewards, axis=1)
+    values = np.zeros(memory_mdp.n_states)
+
+    iterations, has_converged = 0, False
+    while iterations < max_iterations and not has_converged:
+        # Evaluate the policy exactly
+        values = evaluate(memory_mdp, gamma, policy)
+
+        action_values = memory_mdp.get_action_values(values, gamma)
+        policy, is_improved = __improve_policy(policy, action_values, tolerance)
+
+        iterations += 1
+        has_converged = not is_improved
+
+    __set_convergence(metrics, iterations, has_converged)
+
+    return values, policy
+
+
+def modified_policy_iteration(memory_mdp, gamma, tolerance=1e-6, max_iterations=100000, evaluation_iterations=20, metrics=None):
+    rewards = memory_mdp.rewards
+
+    states = np.arange(memory_mdp.n_states)
+
+    values = np.zeros(memory_mdp.n_states)
+
+    iterations, has_converged = 0, False
+    while iterations < max_iterations:
+        action_values = memory_mdp.get_action_values(values, gamma)
+        policy = np.argmax(action_values, axis=1)
+
+        new_values = action_values[states, policy]
+        residual = np.max(np.abs(new_values - values))
+        values = new_values
+
+        iterations += 1
+        has_converged = residual < tolerance
+        if has_converged:
+            break
+
+        # Evaluate the greedy policy partially with a fixed number of backups
+        policy_transition_matrix = get_policy_transition_matrix(memory_mdp, policy)
+        policy_rewards = rewards[states, policy]
+        for _ in range(evaluation_iterations):
+            values = policy_rewards + gamma * (policy_transition_matrix @ values)
+
+    __set_convergence(metrics, iterations, has_converged)
+
+    policy = np.argmax(memory_mdp.get_action_values(values, gamma), axis=1)
+
+    return values, policy
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import scipy.sparse as sp
+
+from cplex_mdp_solver import MemoryMDP
+
+# Entries written with a different format version are never read
+CACHE_FORMAT_VERSION = 1
+ARRAY_NAMES = ['rewards', 'transition_data', 'transition_indices', 'transition_indptr', 'start_state_probabilities']
+
+
+def get_definition_key(domain, definition):
+    definition = {
+        'version': CACHE_FORMAT_VERSION,
+        'domain': domain,
+        'definition': definition
+    }
+    return hashlib.sha256(json.dumps(definition, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get_key(mdp):
+    return get_definition_key(type(mdp).__name__, mdp.domain_definition())
+
+
+class MDPCache:
+    def __init__(self, directory, max_bytes=1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __get_entry_directory(self, key):
+        return os.path.join(self.directory, key)
+
+    def __get_entry_size(self, entry_directory):
+        return sum(os.path.getsize(os.path.join(entry_directory, name)) for name in os.listdir(entry_directory))
+
+    def load(self, mdp):
+        entry_directory = self.__get_entry_directory(get_key(mdp))
+        if not os.path.isdir(entry_directory):
+            return None
+
+        with open(os.path.join(entry_directory, 'labels.json')) as file:
+            labels = json.load(file)
+
+        # The arrays are memory-mapped so that loading an entry does not copy it
+        arrays = {name: np.load(os.path.join(entry_directory, name + '.npy'), mmap_mode='r') for name in ARRAY_NAMES}
+
+        n_states, n_actions = arrays['rewards'].shape
+        transition_probabilities = sp.csr_matrix((arrays['transition_data'], arrays['transition_indices'], arrays['transition_indptr']), shape=(n_states * n_actions, n_states), copy=False)
+
+        # Loading an entry marks it as recently used for eviction
+        os.utime(entry_directory)
+
+        return MemoryMDP.from_arrays(labels['states'], labels['actions'], arrays['rewards'], transition_probabilities, arrays['start_state_probabilities'])
+
+    def store(self, mdp, memory_mdp):
+        key = get_key(mdp)
+
+        transition_matrix = memory_mdp.get_transition_matrix()
+        arrays = {
+            'rewards': memory_mdp.rewards,
+            'transition_data': transition_matrix.data,
+            'transition_indices': transition_matrix.indices,
+            'transition_indptr': transition_matrix.indptr,
+            'start_state_probabilities': memory_mdp.start_state_probabilities
+        }
+
+        # Entries are written to a temporary directory first so that readers never see a partial entry
+        temporary_directory = tempfile.mkdtemp(dir=self.directory, prefix='.' + key)
+        for name, array in arrays.items():
+            np.save(os.path.join(temporary_directory, name + '.npy'), np.asarray(array))
+        with open(os.path.join(temporary_directory, 'labels.json'), 'w') as file:
+            json.dump({'states': list(memory_mdp.states), 'actions': list(memory_mdp.actions)}, file)
+
+        entry_directory = self.__get_entry_directory(key)
+        if os.path.isdir(entry_directory):
+            shutil.rmtree(temporary_directory)
+        else:
+            os.rename(temporary_directory, entry_directory)
+
+        self.evict()
+
+    def get(self, mdp):
+        memory_mdp = self.load(mdp)
+
+        if memory_mdp is None:
+            memory_mdp = MemoryMDP(mdp)
+            self.store(mdp, memory_mdp)
+
+        return memory_mdp
+
+    def invalidate(self, mdp):
+        entry_directory = self.__get_entry_directory(get_key(mdp))
+        if os.path.isdir(entry_directory):
+            shutil.rmtree(entry_directory)
+
+    def clear(self):
+        for key in os.listdir(self.directory):
+            shutil.rmtree(self.__get_entry_directory(key))
+
+    def evict(self):
+        entries = []
+        for key in os.listdir(self.directory):
+            entry_directory = self.__get_entry_directory(key)
+            if not key.startswith('.'):
+                entries.append((os.path.getmtime(entry_directory), self.__get_entry_size(entry_directory), entry_directory))
+
+        total_bytes = sum(size for _, size, _ in entries)
+
+        # The least recently used entries are removed first until the cache fits
+        for _, size, entry_directory in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            shutil.rmtree(entry_directory)
+            total_bytes -= size
@@ -0,0 +1,74 @@
+import numpy as np
+
+TOLERANCE = 1e-9
+
+
+def __get_state_action_pairs(memory_mdp, rows):
+    return [(memory_mdp.states[row // memory_mdp.n_actions], memory_mdp.actions[row % memory_mdp.n_actions]) for row in rows]
+
+
+def validate(memory_mdp, tolerance=TOLERANCE):
+    transition_matrix = memory_mdp.get_transition_matrix()
+    probabilities = transition_matrix.data
+
+    row_sums = np.asarray(transition_matrix.sum(axis=1)).reshape(-1)
+    self_probabilities = np.asarray(transition_matrix.multiply(memory_mdp.get_state_indicator(np.arange(memory_mdp.n_states * memory_mdp.n_actions))).sum(axis=1)).reshape(memory_mdp.n_states, memory_mdp.n_actions)
+
+    rewards = np.asarray(memory_mdp.rewards).reshape(-1)
+    start_state_probabilities = np.asarray(memory_mdp.start_state_probabilities)
+    start_state_total = float(np.sum(start_state_probabilities))
+
+    # Rows without any successor end the episode and every action of an absorbing state stays in place
+    is_dead_end = np.diff(transition_matrix.indptr) == 0
+    invalid_rows = np.flatnonzero(~(np.abs(row_sums - 1) <= tolerance) & ~is_dead_end)
+    dead_end_rows = np.flatnonzero(is_dead_end)
+    absorbing_states = np.flatnonzero(np.all(self_probabilities >= 1 - tolerance, axis=1))
+
+    report = {
+        'tolerance': tolerance,
+        'n_invalid_probabilities': int(np.count_nonzero(~np.isfinite(probabilities))),
+        'n_negative_probabilities': int(np.count_nonzero(probabilities < -tolerance)),
+        'n_probabilities_above_one': int(np.count_nonzero(probabilities > 1 + tolerance)),
+        'invalid_rows': __get_state_action_pairs(memory_mdp, invalid_rows),
+        'invalid_rewards': __get_state_action_pairs(memory_mdp, np.flatnonzero(~np.isfinite(rewards))),
+        'n_invalid_start_state_probabilities': int(np.count_nonzero(~np.isfinite(start_state_probabilities) | (start_state_probabilities < -tolerance) | (start_state_probabilities > 1 + tolerance))),
+        'start_state_total_probability': start_state_total,
+        'dead_end_states': [memory_mdp.states[state] for state in np.unique(dead_end_rows // memory_mdp.n_actions)],
+        'absorbing_states': [memory_mdp.states[state] for state in absorbing_states]
+    }
+
+    # Dead-end and absorbing states are only reported since terminating models are solved just like any other
+    report['is_valid'] = (
+        report['n_invalid_probabilities'] == 0 and
+        report['n_negative_probabilities'] == 0 and
+        report['n_probabilities_above_one'] == 0 and
+        not report['invalid_rows'] and
+        not report['invalid_rewards'] and
+        report['n_invalid_start_state_probabilities'] == 0 and
+        abs(start_state_total - 1) <= tolerance
+    )
+
+    return report
+
+
+def get_summary(report):
+    if report['is_valid']:
+        return "Valid MDP ({} absorbing states, {} dead-end states)".format(len(report['absorbing_states']), len(report['dead_end_states']))
+
+    problems = []
+    if report['n_invalid_probabilities']:
+        problems.append("{} NaN or infinite transition probabilities".format(report['n_invalid_probabilities']))
+    if report['n_negative_probabilities']:
+        problems.append("{} negative transition probabilities".format(report['n_negative_probabilities']))
+    if report['n_probabilities_above_one']:
+        problems.append("{} transition probabilities above 1".format(report['n_probabilities_above_one']))
+    if report['invalid_rows']:
+        problems.append("{} state-action pairs whose probabilities do not sum to 1 (such as {})".format(len(report['invalid_rows']), report['invalid_rows'][0]))
+    if report['invalid_rewards']:
+        problems.append("{} NaN or infinite rewards (such as {})".format(len(report['invalid_rewards']), report['invalid_rewards'][0]))
+    if report['n_invalid_start_state_probabilities']:
+        problems.append("{} invalid start state probabilities".format(report['n_invalid_start_state_probabilities']))
+    if abs(report['start_state_total_probability'] - 1) > report['tolerance']:
+        problems.append("start state probabilities that sum to {}".format(report['start_state_total_probability']))
+
+    return "Invalid MDP: " + "; ".join(problems)
@@ -0,0 +1,102 @@
+import numpy as np
+
+import iterative_mdp_solver
+from cplex_mdp_solver import compile_mdp
+
+RETURN_PERCENTILES = [5, 25, 50, 75, 95]
+
+
+def __get_policy_indices(memory_mdp, policy):
+    # A policy is either a {state: action} dictionary like the ones that solve returns or an array of action indices
+    if isinstance(policy, dict):
+        action_indices = {action: index for index, action in enumerate(memory_mdp.actions)}
+        return np.array([action_indices[policy[state]] for state in memory_mdp.states])
+
+    policy = np.asarray(policy, dtype=np.int64)
+    assert policy.shape == (memory_mdp.n_states,)
+
+    return policy
+
+
+def __get_goal_states(mdp, memory_mdp, is_goal):
+    if is_goal is None:
+        is_goal = getattr(mdp, 'is_goal', None)
+    if is_goal is None:
+        return None
+    return np.array([bool(is_goal(state)) for state in memory_mdp.states])
+
+
+def evaluate_policy(mdp, gamma, policy, method='direct', tolerance=1e-10, max_iterations=10000):
+    memory_mdp = compile_mdp(mdp)
+
+    values = iterative_mdp_solver.evaluate(memory_mdp, gamma, __get_policy_indices(memory_mdp, policy), method, tolerance, max_iterations)
+
+    return {
+        'objective_value': float(np.dot(memory_mdp.start_state_probabilities, values)),
+        'values': {memory_mdp.states[state]: value for state, value in enumerate(values)}
+    }
+
+
+def simulate(mdp, gamma, policy, n_episodes=1000, horizon=1000, seed=None, is_goal=None):
+    memory_mdp = compile_mdp(mdp)
+    policy = __get_policy_indices(memory_mdp, policy)
+    goal_states = __get_goal_states(mdp, memory_mdp, is_goal)
+
+    random = np.random.default_rng(seed)
+
+    # Each row is sampled by inverting the cumulative probabilities of all rows laid end to end
+    policy_transition_matrix = iterative_mdp_solver.get_policy_transition_matrix(memory_mdp, policy)
+    cumulative_probabilities = np.cumsum(policy_transition_matrix.data)
+    row_offsets = np.concatenate([[0.0], cumulative_probabilities])[policy_transition_matrix.indptr]
+    policy_rewards = memory_mdp.rewards[np.arange(memory_mdp.n_states), policy]
+
+    states = random.choice(memory_mdp.n_states, size=n_episodes, p=memory_mdp.start_state_probabilities)
+
+    returns = np.zeros(n_episodes)
+    goal_steps = np.full(n_episodes, -1)
+    discount = 1.0
+
+    # An episode ends once it reaches a dead-end state that has no successors
+    has_successors = np.diff(policy_transition_matrix.indptr) > 0
+    is_active = np.ones(n_episodes, dtype=bool)
+
+    def record_goals(step, states):
+        if goal_states is not None:
+            goal_steps[(goal_steps < 0) & goal_states[states]] = step
+
+    # Every episode takes one step at a time in lockstep with all of the others
+    for step in range(horizon):
+        record_goals(step, states)
+
+        returns[is_active] += discount * policy_rewards[states[is_active]]
+        discount *= gamma
+
+        is_active &= has_successors[states]
+        active_states = states[is_active]
+
+        start, stop = row_offsets[active_states], row_offsets[active_states + 1]
+        samples = start + random.random(len(active_states)) * (stop - start)
+        entries = np.searchsorted(cumulative_probabilities, samples, side='right')
+
+        # Rounding can push a sample past the last entry of its row
+        entries = np.clip(entries, policy_transition_matrix.indptr[active_states], policy_transition_matrix.indptr[active_states + 1] - 1)
+        states[is_active] = policy_transition_matrix.indices[entries]
+
+    record_goals(horizon, states)
+
+    report = {
+        'n_episodes': n_episodes,
+        'horizon': horizon,
+        'returns': returns,
+        'mean_return': float(np.mean(returns)),
+        'std_return': float(np.std(returns)),
+        'return_percentiles': dict(zip(RETURN_PERCENTILES, np.percentile(returns, RETURN_PERCENTILES).tolist()))
+    }
+
+    # Goal statistics are only reported for MDPs that can tell their goal states apart
+    if goal_states is not None:
+        is_reaching_goal = goal_steps >= 0
+        report['goal_rate'] = float(np.mean(is_reaching_goal))
+        report['mean_steps_to_goal'] = float(np.mean(goal_steps[is_reaching_goal])) if np.any(is_reaching_goal) else None
+
+    return report
@@ -1,3 +1,11 @@
+import numpy as np
+
+import mdp_validation
+from cplex_mdp_solver import MemoryMDP
+from grid_world_mdp import GOAL, START, WALL, get_cells
+from mdp_validation import TOLERANCE
+
+
 def print_states(mdp):
     print("States:")
 
@@ -15,29 +23,23 @@ def print_actions(mdp):
 def print_transition_function(mdp):
     print("Transition Function:")
 
-    is_valid = True
-
-    for state in mdp.states():
-        for action in mdp.actions():
-            print(f"  Transition: ({state}, {action})")
-
-            total_probability = 0
-
-            for successor_state in mdp.states():
-                probability = mdp.transition_function(state, action, successor_state)
-
-                total_probability += probability
+    # The MDP is compiled once so that only the nonzero successors of each (state, action) pair are visited
+    memory_mdp = MemoryMDP(mdp)
+    transition_matrix = memory_mdp.get_transition_matrix()
+    total_probabilities = np.asarray(transition_matrix.sum(axis=1)).reshape(-1)
 
-                if probability > 0:
-                    print(f"    Successor State: {successor_state} -> {probability}")
+    for row in range(memory_mdp.n_states * memory_mdp.n_actions):
+        state, action = divmod(row, memory_mdp.n_actions)
+        print(f"  Transition: ({memory_mdp.states[state]}, {memory_mdp.actions[action]})")
 
-            is_valid = is_valid and total_probability == 1.0
-            print(f"    Total Probability: {total_probability}")
+        for entry in range(transition_matrix.indptr[row], transition_matrix.indptr[row + 1]):
+            print(f"    Successor State: {memory_mdp.states[transition_matrix.indices[entry]]} -> {transition_matrix.data[entry]}")
 
-            if not is_valid:
-                return
+        print(f"    Total Probability: {total_probabilities[row]}")
 
-    print(f"  Is Valid: {is_valid}")
+    report = mdp_validation.validate(memory_mdp)
+    print(f"  Is Valid: {report['is_valid']}")
+    print(f"  {mdp_validation.get_summary(report)}")
 
 
 def print_reward_function(mdp):
@@ -63,7 +65,7 @@ def print_start_state_function(mdp):
 
     print(f"  Total Probability: {total_probability}")
 
-    is_valid = total_probability == 1.0
+    is_valid = abs(total_probability - 1.0) <= TOLERANCE
     print(f"  Is Valid: {is_valid}")
 
 
@@ -76,15 +78,17 @@ def print_mdp(mdp):
 
 
 def print_grid_world_domain(grid_world):
-    for row in range(len(grid_world)):
+    cells = get_cells(grid_world)
+
+    for row in range(cells.shape[0]):
         text = ""
 
-        for column in range(len(grid_world[row])):
-            if grid_world[row][column] == 'W':
+        for column in range(cells.shape[1]):
+            if cells[row, column] == WALL:
                 text += "\u25A0"
-            elif grid_world[row][column] == 'G':
+            elif cells[row, column] == GOAL:
                 text += "\u272A"
-            elif grid_world[row][column] == 'S':
+            elif cells[row, column] == START:
                 text += "\u229B"
             else:
                 text += "\u25A1"
@@ -102,12 +106,14 @@ def print_grid_world_policy(grid_world, policy):
         'WEST': '\u2190'
     }
 
-    for row in range(len(grid_world)):
+    cells = get_cells(grid_world)
+
+    for row in range(cells.shape[0]):
         text = ""
 
-        for column in range(len(grid_world[row])):
-            state = len(grid_world[row]) * row + column
-            if grid_world[row][column] == 'W':
+        for column in range(cells.shape[1]):
+            state = cells.shape[1] * row + column
+            if cells[row, column] == WALL:
                 text += "\u25A0"
             else:
                 text += symbols[policy[state]]
@@ -0,0 +1,197 @@
+import argparse
+import asyncio
+import json
+import socket
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import cplex_mdp_solver
+import mdp_cache
+from cplex_mdp_solver import MemoryMDP
+from delivery_mdp import DeliveryMDP
+from grid_world_mdp import GridWorldMDP
+
+DOMAINS = ['delivery', 'grid_world']
+REQUIRED_FIELDS = {
+    'delivery': ['world_map', 'pickup_location', 'dropoff_location'],
+    'grid_world': ['grid_world']
+}
+
+# Options that only make sense within a single process are never taken from a request
+EXCLUDED_OPTIONS = ['cache', 'callback', 'quiet']
+
+# Each worker process keeps its own compiled models so that they never have to be sent between processes
+__models = None
+
+
+def check_request(request):
+    if not isinstance(request, dict):
+        raise ValueError("A request must be a JSON object")
+    if request.get('domain') not in DOMAINS:
+        raise ValueError("Unknown domain {!r} (expected one of {})".format(request.get('domain'), ', '.join(DOMAINS)))
+
+    missing_fields = [field for field in REQUIRED_FIELDS[request['domain']] if field not in request]
+    if missing_fields:
+        raise ValueError("A {} request needs {}".format(request['domain'], ', '.join(missing_fields)))
+
+    if not isinstance(request.get('options', {}), dict):
+        raise ValueError("The options of a request must be a JSON object")
+
+
+def get_model_key(request):
+    # Runs in a worker process since hashing a large grid world would block the event loop
+    if request['domain'] == 'delivery':
+        return mdp_cache.get_definition_key('DeliveryMDP', {
+            'world_map': request['world_map'],
+            'pickup_location': request['pickup_location'],
+            'dropoff_location': request['dropoff_location']
+        })
+
+    # Grid worlds are identified by a digest of their cells rather than by the cells themselves
+    return mdp_cache.get_key(GridWorldMDP(request['grid_world']))
+
+
+def compile_domain(request):
+    if request['domain'] == 'delivery':
+        mdp = DeliveryMDP(request['world_map'], request['pickup_location'], request['dropoff_location'])
+    else:
+        mdp = GridWorldMDP(request['grid_world'])
+    return MemoryMDP(mdp)
+
+
+def initialize_worker(max_models):
+    global __models
+    __models = LRUCache(max_models)
+
+
+def solve_domain(request, model_key, gamma, options):
+    # Runs in a worker process that compiles the domain unless it still has it from an earlier request
+    memory_mdp = __models.get(model_key)
+    if memory_mdp is None:
+        memory_mdp = compile_domain(request)
+        __models.put(model_key, memory_mdp)
+
+    return cplex_mdp_solver.solve(memory_mdp, gamma, quiet=True, **options)
+
+
+def encode_response(response):
+    # Q-tables are NumPy arrays and NumPy scalars can show up in values
+    return (json.dumps(response, default=lambda value: value.tolist()) + '\n').encode('utf-8')
+
+
+class LRUCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+class SolverService:
+    def __init__(self, workers=None, max_models=32, max_solutions=256):
+        # Every worker keeps up to max_models compiled models of its own
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=initialize_worker, initargs=(max_models,))
+
+        self.solutions = LRUCache(max_solutions)
+
+        # Identical requests that arrive while one is still being solved wait for the same task
+        self.pending_solutions = {}
+
+    async def __run_in_executor(self, function, *arguments):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *arguments)
+
+    async def __get_or_create_solution(self, key, create):
+        solution = self.solutions.get(key)
+        if solution is not None:
+            return solution
+
+        if key in self.pending_solutions:
+            return await asyncio.shield(self.pending_solutions[key])
+
+        task = asyncio.ensure_future(create())
+        self.pending_solutions[key] = task
+        try:
+            solution = await asyncio.shield(task)
+        finally:
+            del self.pending_solutions[key]
+
+        self.solutions.put(key, solution)
+
+        return solution
+
+    async def solve(self, request):
+        check_request(request)
+
+        model_key = await self.__run_in_executor(get_model_key, request)
+
+        gamma = float(request.get('gamma', 0.99))
+        options = {name: value for name, value in request.get('options', {}).items() if name not in EXCLUDED_OPTIONS}
+        solution_key = (model_key, gamma, json.dumps(options, sort_keys=True))
+
+        async def create_solution():
+            return await self.__run_in_executor(solve_domain, request, model_key, gamma, options)
+
+        return await self.__get_or_create_solution(solution_key, create_solution)
+
+    async def handle_connection(self, reader, writer):
+        # Each line is one JSON request that is answered with one JSON line in the same order
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                try:
+                    response = await self.solve(json.loads(line))
+                except Exception as error:
+                    response = {'error': '{}: {}'.format(type(error).__name__, error)}
+
+                writer.write(encode_response(response))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+def request_solution(request, host='127.0.0.1', port=8765):
+    with socket.create_connection((host, port)) as connection:
+        connection.sendall((json.dumps(request) + '\n').encode('utf-8'))
+        with connection.makefile('r', encoding='utf-8') as file:
+            return json.loads(file.readline())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serves MDP solutions over newline-delimited JSON on a local socket.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-models', type=int, default=32, help='compiled models kept by each worker')
+    parser.add_argument('--max-solutions', type=int, default=256)
+    arguments = parser.parse_args()
+
+    service = SolverService(arguments.workers, arguments.max_models, arguments.max_solutions)
+    try:
+        asyncio.run(service.serve(arguments.host, arguments.port))
+    finally:
+        service.shutdown()
+
+
+if __name__ == '__main__':
+    main()